@@ -3,10 +3,32 @@ import tia.bbg.datamgr as dm
 from datetime import datetime
 from tia.bbg import LocalTerminal
 
-def bbg_load_ts(bbg_tckr, bbg_flds, start='1/1/1955', end='TODAY'):
+from bbg_budget import BbgDataBudget, BudgetExceededError
+
+# data budget charged by every request; None = unlimited
+_DATA_BUDGET = None
+
+# contracts per FUT_CHAIN response, for budget estimates: with / without expired contracts
+EST_CHAIN_LENGTH = {True: 200, False: 20}
+
+
+def set_data_budget(budget):
+    global _DATA_BUDGET
+    _DATA_BUDGET = budget
+
+
+def get_data_budget():
+    return _DATA_BUDGET
+
+
+def bbg_load_ts(bbg_tckr, bbg_flds, start='1/1/1955', end='TODAY', est_start=None, est_end=None):
+    """est_start/est_end narrow the budget estimate to the dates data is expected for"""
     if end == 'TODAY':
         end = datetime.now().strftime("%m/%d/%Y")
 
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.reserve(BbgDataBudget.estimate_ts_cost(1, len(bbg_flds), est_start or start, est_end or end))
+
     def replace_australia(flds):
         def rep(f):
             return 'fut_norm_px' if f == 'px_last' else f
@@ -28,18 +50,50 @@ def bbg_load_ts(bbg_tckr, bbg_flds, start='1/1/1955', end='TODAY'):
     df = res.as_frame()[bbg_tckr]
     df.columns = revert_fields(df.columns)
 
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.charge(len(df) * len(bbg_flds))
+
     return df
 
 
 def bbg_load_meta(bbg_tckr, bbg_flds):
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.consume(BbgDataBudget.estimate_ref_cost(1, len(bbg_flds)))
+
     resp = LocalTerminal.get_reference_data(bbg_tckr, bbg_flds)
     return resp.as_frame().loc[bbg_tckr]
 
 
 def get_bbg_futures_chain(bbg_root, yellow_key):
     tckr = bbg_root.upper() + 'A ' + yellow_key
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.reserve(BbgDataBudget.estimate_ref_cost(EST_CHAIN_LENGTH[True], 1))
+
     resp = LocalTerminal.get_reference_data(tckr, 'FUT_CHAIN ', {'INCLUDE_EXPIRED_CONTRACTS': 1})
     x = resp.as_map()
-    return list(x.values()[0].values()[0]['Security Description'])
+    chain = list(list(list(x.values())[0].values())[0]['Security Description'])
+
+    # one point per contract returned
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.charge(len(chain))
+
+    return chain
+
+
+def get_bbg_futures_chains(bbg_roots, yellow_keys, include_expired=True):
+    """FUT_CHAIN for several roots in a single request. returns {bbg_root: [tckrs]}"""
+    tckrs = [bbg_root.upper() + 'A ' + yellow_key for bbg_root, yellow_key in zip(bbg_roots, yellow_keys)]
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.reserve(BbgDataBudget.estimate_ref_cost(len(tckrs) * EST_CHAIN_LENGTH[include_expired], 1))
+
+    resp = LocalTerminal.get_reference_data(tckrs, 'FUT_CHAIN', {'INCLUDE_EXPIRED_CONTRACTS': int(include_expired)})
+    x = resp.as_map()
+
+    chains = {bbg_root: list(list(x[tckr].values())[0]['Security Description'])
+              for bbg_root, tckr in zip(bbg_roots, tckrs) if tckr in x}
 
+    # one point per contract returned
+    if _DATA_BUDGET is not None:
+        _DATA_BUDGET.charge(sum(len(chain) for chain in chains.values()))
 
+    return chains
@@ -0,0 +1,150 @@
+
+import os
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from bbg_io import atomic_write
+
+
+class BudgetExceededError(Exception):
+    """raised when a request would breach the daily or monthly data limit"""
+    pass
+
+
+class BbgDataBudget():
+    """Budgets terminal data usage, measured in data points (securities x fields x days).
+
+    Requests are throttled through a token bucket (rate points/sec, up to burst points at once) and
+    counted against daily and monthly ceilings. Once the day's remaining budget drops below
+    low_priority_reserve (fraction of the daily limit), low priority work is deferred so the rest of the
+    allowance is kept for current securities. Usage counters are persisted to usage_file across runs."""
+
+    LOW = 0
+    NORMAL = 1
+
+    DT_FORMAT = '%m/%d/%Y'
+
+    def __init__(self, usage_file, daily_limit, monthly_limit=None, rate=None, burst=None,
+                 low_priority_reserve=0.2):
+        self.usage_file = usage_file
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.low_priority_reserve = low_priority_reserve
+
+        # -- internals -----
+        self._tokens = self.burst
+        self._last_refill = time.time()
+        self._usage = self._load_usage()
+
+    # --- Cost Estimates ----------------------------------------
+    @classmethod
+    def estimate_ts_cost(cls, n_secs, n_flds, start, end):
+        """data points for a historical request; start/end as mm/dd/YYYY strings"""
+        start_dt = datetime.strptime(start, cls.DT_FORMAT).date()
+        end_dt = datetime.strptime(end, cls.DT_FORMAT).date()
+        n_days = max(int(np.busday_count(start_dt, end_dt)) + 1, 1)
+
+        return n_secs * n_flds * n_days
+
+    @staticmethod
+    def estimate_ref_cost(n_secs, n_flds):
+        """data points for a reference data request"""
+        return n_secs * n_flds
+
+    # --- Usage Counters ----------------------------------------
+    def _load_usage(self):
+        if os.path.exists(self.usage_file):
+            with open(self.usage_file, 'r') as f:
+                return json.load(f)
+
+        return {'day': None, 'day_used': 0, 'month': None, 'month_used': 0}
+
+    def _save_usage(self):
+        usage = json.dumps(self._usage, indent=1)
+        atomic_write(self.usage_file, lambda f: f.write(usage), mode='w')
+
+    def _roll_counters(self):
+        now = datetime.now()
+        day, month = now.strftime('%Y-%m-%d'), now.strftime('%Y-%m')
+
+        if self._usage['day'] != day:
+            self._usage['day'], self._usage['day_used'] = day, 0
+
+        if self._usage['month'] != month:
+            self._usage['month'], self._usage['month_used'] = month, 0
+
+    @property
+    def used_today(self):
+        self._roll_counters()
+        return self._usage['day_used']
+
+    @property
+    def used_this_month(self):
+        self._roll_counters()
+        return self._usage['month_used']
+
+    @property
+    def remaining_today(self):
+        remaining = self.daily_limit - self.used_today
+        if self.monthly_limit is not None:
+            remaining = min(remaining, self.monthly_limit - self.used_this_month)
+
+        return max(remaining, 0)
+
+    # --- Throttling ----------------------------------------
+    def _wait_for_tokens(self, cost):
+        if self.rate is None:
+            return
+
+        # requests larger than the bucket wait for a full bucket and leave it in deficit
+        need = min(cost, self.burst)
+        while True:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+
+            if self._tokens >= need:
+                break
+
+            time.sleep((need - self._tokens) / float(self.rate))
+
+    # --- Interface ----------------------------------------
+    def should_defer(self, priority=NORMAL):
+        """True if work of this priority should wait for a later run"""
+        if priority > self.LOW:
+            return False
+
+        return self.remaining_today < self.low_priority_reserve * self.daily_limit
+
+    def reserve(self, est_cost):
+        """check an estimated request against the ceilings and throttle it. Raises BudgetExceededError if
+        it would breach a limit. Charge the actual cost once the response arrives"""
+        if est_cost > self.remaining_today:
+            raise BudgetExceededError('request of {} points exceeds remaining budget of {} points'
+                                      .format(est_cost, self.remaining_today))
+
+        self._wait_for_tokens(est_cost)
+
+    def charge(self, cost):
+        """count the actual points of a response"""
+        if self.rate is not None:
+            self._tokens -= cost
+
+        self._roll_counters()
+        self._usage['day_used'] += cost
+        self._usage['month_used'] += cost
+        self._save_usage()
+
+    def consume(self, cost):
+        """reserve & charge a request whose cost is known up front"""
+        self.reserve(cost)
+        self.charge(cost)
+
+    def __repr__(self):
+        return '<DATA BUDGET: today={}/{}, month={}/{}>'.format(self.used_today, self.daily_limit,
+                                                              self.used_this_month, self.monthly_limit)
@@ -0,0 +1,350 @@
+
+import os
+import time
+import binascii
+import threading
+import traceback
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import pandas as pd
+from pandas.tseries.offsets import CustomBusinessDay
+
+from bbg_budget import BudgetExceededError
+
+DEFAULT_ADDRESS = ('localhost', 6010)
+
+AUTHKEY_ENV = 'BBG_DAEMON_AUTHKEY'
+DEFAULT_AUTHKEY_FILE = os.path.join(os.path.expanduser('~'), '.bbg_daemon_key')
+
+# a database whose refresh failed is retried after
+RETRY_DELAY = pd.Timedelta(minutes=15)
+
+
+def load_authkey(fname=DEFAULT_AUTHKEY_FILE, create=False):
+    """auth key shared by daemon & clients: $BBG_DAEMON_AUTHKEY, else the key file, readable by the user only.
+    create=True writes a random key file if there is none. Requests are pickles, so keep the key private"""
+    key = os.environ.get(AUTHKEY_ENV)
+    if key:
+        return key if isinstance(key, bytes) else key.encode('ascii')
+
+    if not os.path.exists(fname):
+        if not create:
+            raise IOError('no daemon auth key: set ${} or create {}'.format(AUTHKEY_ENV, fname))
+
+        print('...writing new daemon auth key to <{}>'.format(fname))
+        fd = os.open(fname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(binascii.hexlify(os.urandom(32)))
+
+    with open(fname, 'rb') as f:
+        return f.read().strip()
+
+
+def next_budget_day(now=None):
+    """when the data budget's daily counter rolls over"""
+    now = now if now is not None else datetime.now()
+    return pd.Timestamp(now.date()) + pd.Timedelta(days=1)
+
+
+class EodSchedule():
+    """End-of-day data availability for a group of securities.
+
+    Data for a business day (weekmask + holiday calendar, or an exchange's own business day) is final
+    after cutoff_hour in timezone tz (e.g. 'America/New_York'; the machine's local time if None). data_lag
+    shifts the expected last datapoint back from the release date, e.g. CoT data is released on Friday but
+    dated the Tuesday before. Times passed in and returned are local time, like datetime.now()."""
+
+    def __init__(self, cutoff_hour=19, weekmask='Mon Tue Wed Thu Fri', calendar=None, data_lag=None, bday=None,
+                 tz=None):
+        self.cutoff_hour = cutoff_hour
+        self.bday = bday if bday is not None else CustomBusinessDay(weekmask=weekmask, calendar=calendar)
+        self.data_lag = data_lag if data_lag is not None else pd.Timedelta(0)
+        self.tz = tz
+
+    @classmethod
+    def for_exchange(cls, mic, cutoff_hour=19, data_lag=None, tz=None):
+        """schedule on an exchange's sessions (ISO MIC, e.g. XNYS), from the optional exchange_calendars
+        package. Without it, falls back to every weekday"""
+        try:
+            import exchange_calendars
+        except ImportError:
+            print('...exchange_calendars not installed, {} schedule uses every weekday'.format(mic))
+            return cls(cutoff_hour, data_lag=data_lag, tz=tz)
+
+        return cls(cutoff_hour, data_lag=data_lag, bday=exchange_calendars.get_calendar(mic).day, tz=tz)
+
+    # --- Timezones ----------------------------------------
+    def _to_tz(self, now):
+        """local time -> wall time in tz"""
+        if self.tz is None:
+            return now
+
+        utc = pd.Timestamp(time.mktime(now.timetuple()), unit='s', tz='UTC')
+        return utc.tz_convert(self.tz).tz_localize(None)
+
+    def _from_tz(self, t):
+        """wall time in tz -> local time"""
+        if self.tz is None:
+            return t
+
+        return datetime.fromtimestamp(pd.Timestamp(t).tz_localize(self.tz).value / 1e9)
+
+    # --- Interface ----------------------------------------
+    def last_close(self, now=None):
+        """last business day whose data is final as of now"""
+        now = self._to_tz(now if now is not None else datetime.now())
+        today = pd.Timestamp(now.date())
+
+        if self.bday.is_on_offset(today) and now.hour >= self.cutoff_hour:
+            return today
+
+        return today - self.bday
+
+    def next_trigger(self, now=None):
+        """next time new data becomes final"""
+        now = self._to_tz(now if now is not None else datetime.now())
+        today = pd.Timestamp(now.date())
+
+        if self.bday.is_on_offset(today) and now.hour < self.cutoff_hour:
+            day = today
+        else:
+            day = today + self.bday
+
+        return self._from_tz(day + pd.Timedelta(hours=self.cutoff_hour))
+
+    def last_data_date(self, now=None):
+        """date of the last datapoint that is final as of now"""
+        return self.last_close(now) - self.data_lag
+
+    def is_due(self, sec, now=None):
+        """True if sec is missing data that should be available by now"""
+        if sec.is_expired:
+            return False
+
+        if len(sec) == 0:
+            return True
+
+        return sec.last_datapoint < self.last_data_date(now)
+
+
+class BbgRefreshDaemon():
+    """Resident refresh service.
+
+    Keeps every security ({db: {key: BbgSecurity}}, as built for the batch update) loaded in memory and
+    refreshes each database when its EodSchedule says new data is final, updating only securities that
+    are due and writing each one through to its local file. Local clients (BbgDaemonClient) can query
+    status, trigger a refresh and fetch the in-memory data of a security."""
+
+    def __init__(self, securities, authkey, schedules=None, default_schedule=None, address=DEFAULT_ADDRESS):
+        if not authkey:
+            raise ValueError('an auth key is required, see load_authkey()')
+
+        self.securities = securities
+        self.schedules = schedules if schedules is not None else {}
+        self.default_schedule = default_schedule if default_schedule is not None else EodSchedule()
+        self.address = address
+        self.authkey = authkey
+
+        # -- internals -----
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._listener = None
+        self._last_refresh = {}
+        self._next_trigger = {}
+        self._loaded = False
+
+    def schedule(self, db):
+        return self.schedules.get(db, self.default_schedule)
+
+    # --- State ----------------------------------------
+    def load(self):
+        """one-off load of all local files into memory"""
+        with self._lock:
+            for db, seclist in self.securities.items():
+                print('--------------LOADING {}----------------'.format(db))
+                for key, sec in seclist.items():
+                    sec.load_local_data()
+
+            self._loaded = True
+
+    def _is_due(self, db, key, now=None):
+        try:
+            return self.schedule(db).is_due(self.securities[db][key], now)
+        except Exception as e:
+            print('Error checking security {} in {}: {}'.format(key, db, e))
+            return False
+
+    def due(self, db, now=None):
+        return [key for key in self.securities[db].keys() if self._is_due(db, key, now)]
+
+    def refresh(self, db=None, force=False):
+        """update securities that are due (or all, if force) in db, or in every db. returns {db: [errors]}"""
+        dbs = [db] if db is not None else list(self.securities.keys())
+        errors = {}
+        exhausted = False
+
+        with self._lock:
+            if not self._loaded:
+                self.load()
+
+            for db in dbs:
+                if exhausted:
+                    # retry once the budget day rolls over
+                    self._next_trigger[db] = min(self.schedule(db).next_trigger(), next_budget_day())
+                    continue
+
+                print('--------------REFRESHING {}----------------'.format(db))
+                schedule = self.schedule(db)
+
+                # fetch only data that is final: before the cutoff, today's bar would be intraday
+                now = datetime.now()
+                end_dt = schedule.last_data_date(now).strftime('%m/%d/%Y')
+
+                errors[db] = []
+                for key, sec in list(self.securities[db].items()):
+                    try:
+                        if not force and not schedule.is_due(sec, now):
+                            continue
+
+                        sec.update(reload=False, end_dt=end_dt)
+                    except BudgetExceededError as e:
+                        print('DATA BUDGET EXHAUSTED: {}'.format(e))
+                        exhausted = True
+                        break
+                    except Exception as e:
+                        print('Error updating security {}: {}'.format(sec.bb_tckr, e))
+                        errors[db].append(key)
+
+                if exhausted:
+                    self._next_trigger[db] = min(self.schedule(db).next_trigger(), next_budget_day())
+                else:
+                    self._last_refresh[db] = datetime.now()
+                    self._next_trigger[db] = self.schedule(db).next_trigger()
+
+        return errors
+
+    def status(self):
+        return {db: {'securities': len(seclist),
+                     'due': len(self.due(db)),
+                     'last_refresh': self._last_refresh.get(db),
+                     'next_trigger': self._next_trigger.get(db)}
+                for db, seclist in self.securities.items()}
+
+    def get(self, db, key):
+        sec = self.securities[db][key]
+        return sec.to_dict()
+
+    # --- Scheduler ----------------------------------------
+    def _run_schedule(self):
+        while not self._stop.is_set():
+            # databases without a trigger yet (e.g. anything missed while the service was down) are due now
+            for db in list(self.securities.keys()):
+                trigger = self._next_trigger.get(db)
+                if trigger is not None and trigger > datetime.now():
+                    continue
+
+                try:
+                    self.refresh(db)
+                except Exception:
+                    print('Error refreshing {}, retrying in {}'.format(db, RETRY_DELAY))
+                    traceback.print_exc()
+                    self._next_trigger[db] = datetime.now() + RETRY_DELAY
+
+            # wake at the next trigger, and at least every minute to stay robust to clock changes
+            next_trigger = min(self._next_trigger.values()) if self._next_trigger else datetime.now()
+            wait = (next_trigger - datetime.now()).total_seconds()
+            self._stop.wait(min(max(wait, 1), 60))
+
+    # --- Local Requests ----------------------------------------
+    def _handle(self, conn):
+        commands = {'status': self.status, 'refresh': self.refresh, 'due': self.due, 'get': self.get}
+
+        try:
+            cmd, args = conn.recv()
+            try:
+                conn.send(('ok', commands[cmd](*args)))
+            except Exception as e:
+                conn.send(('error', '{}: {}'.format(e.__class__.__name__, e)))
+        finally:
+            conn.close()
+
+    def _serve(self):
+        self._listener = Listener(self.address, authkey=self.authkey)
+        print('...serving bloomberg data on {}'.format(self.address))
+
+        while not self._stop.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, IOError, EOFError, AuthenticationError):
+                # listener closed by stop(), or a client failed authentication
+                continue
+
+            t = threading.Thread(target=self._handle, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    # --- Lifecycle ----------------------------------------
+    def start(self):
+        """run scheduler & request server in background threads"""
+        self._stop.clear()
+        for target in [self._run_schedule, self._serve]:
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.close()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def __repr__(self):
+        return '<BBG REFRESH DAEMON: address={}, dbs={}>'.format(self.address, list(self.securities.keys()))
+
+
+class BbgDaemonClient():
+    """Local client of a running BbgRefreshDaemon"""
+
+    def __init__(self, authkey, address=DEFAULT_ADDRESS):
+        if not authkey:
+            raise ValueError('an auth key is required, see load_authkey()')
+
+        self.address = address
+        self.authkey = authkey
+
+    def _request(self, cmd, *args):
+        conn = Client(self.address, authkey=self.authkey)
+        try:
+            conn.send((cmd, args))
+            status, result = conn.recv()
+        finally:
+            conn.close()
+
+        if status != 'ok':
+            raise RuntimeError(result)
+
+        return result
+
+    def status(self):
+        return self._request('status')
+
+    def due(self, db):
+        return self._request('due', db)
+
+    def refresh(self, db=None, force=False):
+        return self._request('refresh', db, force)
+
+    def get(self, db, key):
+        """{'ts': ..., 'meta': ..., ...} of a security as currently held by the daemon"""
+        return self._request('get', db, key)
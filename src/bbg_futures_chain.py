@@ -0,0 +1,136 @@
+
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+
+from bbg_api import get_bbg_futures_chains
+from bbg_io import atomic_write
+from bbg_symbology import BbgFuturesTckr, FuturesChainReference, FUTURES_MONTHS
+
+# rows above the tickers in each chain column: NumGen, YellowKey, Alias
+CHAIN_HEADER_ROWS = 3
+
+
+def contract_dates(tckrs, first_year=1900):
+    """(year, month) of each contract in a chronologically ordered chain. Bloomberg drops the decade on
+    active contracts, so 1 digit years resolve to the first matching year on/after the previous contract"""
+    dates = []
+    prev_yr = first_year
+
+    for tckr in tckrs:
+        btckr = BbgFuturesTckr(tckr)
+        yr = int(btckr.year)
+
+        if len(btckr.year) == 1:
+            full_yr = prev_yr - prev_yr % 10 + yr
+            if full_yr < prev_yr:
+                full_yr = full_yr + 10
+        else:
+            full_yr = yr + (1900 if yr > 50 else 2000)
+
+        dates.append((full_yr, FUTURES_MONTHS[btckr.month]))
+        prev_yr = full_yr
+
+    return dates
+
+
+def _with_2digit_year(tckr, full_yr):
+    btckr = BbgFuturesTckr(tckr)
+    return btckr.root + btckr.month + str(full_yr)[-2:] + ' ' + btckr.yk
+
+
+def _is_stale(dates):
+    """contracts listed since the last refresh may already have expired"""
+    today = datetime.today()
+    return len(dates) == 0 or dates[-1] < (today.year, today.month)
+
+
+def merge_chain(stored, fetched, first_year=1900):
+    """merge fetched tickers into a stored chain. returns (merged chain, newly listed tickers)"""
+    stored_dates = contract_dates(stored)
+    known_tckrs = set(stored)
+    known_dates = set(stored_dates)
+
+    new, new_dates = [], []
+    for tckr, dt in zip(fetched, contract_dates(fetched, first_year)):
+        if dt in known_dates:
+            continue
+
+        # same 1 digit ticker as a contract a decade earlier - store it unambiguously
+        if tckr in known_tckrs:
+            tckr = _with_2digit_year(tckr, dt[0])
+
+        new.append(tckr)
+        new_dates.append(dt)
+        known_dates.add(dt)
+
+    merged = sorted(zip(stored + new, stored_dates + new_dates), key=lambda x: x[1])
+    return [tckr for tckr, dt in merged], new
+
+
+# --- File / IO ----------------------------------------
+def load_chain_file(chain_file):
+    """{bbg_root: [NumGen, YellowKey, Alias, tckr, ...]} in file column order"""
+    df = pd.read_csv(chain_file, dtype=str)
+    return OrderedDict((root, [v for v in df[root] if isinstance(v, str)]) for root in df.columns)
+
+
+def write_chain_file(chains, chain_file):
+    df = pd.concat([pd.Series(col, name=root) for root, col in chains.items()], axis=1)
+
+    print('...writing futures chain file <{}>'.format(chain_file))
+    # rendered to bytes: text mode handles on windows would turn to_csv's line endings into \r\r\n
+    csv = df.to_csv(index=False).encode('utf-8')
+    atomic_write(chain_file, lambda f: f.write(csv))
+
+
+# --- Chain Maintenance ----------------------------------------
+def update_futures_chain(chain_file, roots_file, batch_size=25, include_expired=False):
+    """Refresh the futures chain file for every root in roots_file.
+
+    Roots whose chain is current only fetch active contracts; new roots, and roots whose last stored
+    contract has passed (something may have listed and expired since), fetch the full chain including
+    expired contracts. Only newly listed contracts are added, the file is replaced atomically and the
+    shared FuturesChainReference cache is reloaded. Returns {bbg_root: [new tckrs]}"""
+    chains = load_chain_file(chain_file)
+    roots = pd.read_csv(roots_file)
+
+    full_roots, delta_roots = [], []
+    for idx, (root, num_gen, yk, alias) in roots.iterrows():
+        if root not in chains:
+            print('...adding new root {} {}'.format(root, yk))
+            chains[root] = [str(num_gen), yk, alias]
+
+        tckrs = chains[root][CHAIN_HEADER_ROWS:]
+        if include_expired or _is_stale(contract_dates(tckrs)):
+            full_roots.append((root, yk))
+        else:
+            delta_roots.append((root, yk))
+
+    new_contracts = {}
+    for root_list, expired in [(full_roots, True), (delta_roots, False)]:
+        first_year = 1900 if expired else datetime.today().year
+
+        for i in range(0, len(root_list), batch_size):
+            batch = root_list[i:i + batch_size]
+
+            print('...loading FUT_CHAIN for {} roots (include expired={})'.format(len(batch), expired))
+            fetched = get_bbg_futures_chains([r for r, yk in batch], [yk for r, yk in batch], include_expired=expired)
+
+            for root, tckrs in fetched.items():
+                header, stored = chains[root][:CHAIN_HEADER_ROWS], chains[root][CHAIN_HEADER_ROWS:]
+                merged, new = merge_chain(stored, tckrs, first_year)
+
+                if len(new) > 0:
+                    print('..{}: {} new contracts {}'.format(root, len(new), new))
+                    chains[root] = header + merged
+                    new_contracts[root] = new
+
+    if len(new_contracts) == 0:
+        print('..futures chain is up to date! Done!')
+        return new_contracts
+
+    write_chain_file(chains, chain_file)
+    FuturesChainReference.reload(chain_file)
+
+    return new_contracts
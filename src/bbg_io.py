@@ -0,0 +1,57 @@
+
+import os
+import stat
+import tempfile
+
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
+
+# read once at import: os.umask() can only be read by setting it, which would race other threads later
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def replace_file(src, dst):
+    """rename src to dst, replacing dst if it exists"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    elif os.name == 'nt':
+        # python 2 on windows: os.rename fails if dst exists
+        import ctypes
+        move_file = ctypes.windll.kernel32.MoveFileExW
+        move_file.argtypes = [ctypes.c_wchar_p, ctypes.c_wchar_p, ctypes.c_uint32]
+
+        if not move_file(src, dst, MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH):
+            raise ctypes.WinError()
+    else:
+        # python 2 on posix: rename replaces atomically
+        os.rename(src, dst)
+
+
+def _file_mode(fname):
+    """permissions of fname, or those a new file would get under the umask"""
+    try:
+        return stat.S_IMODE(os.stat(fname).st_mode)
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write(fname, writer, mode='wb'):
+    """write a file through writer(f) into a temp file next to fname, then rename it into place.
+    Readers only ever see the old or the new file, never a partially written one."""
+    fldr = os.path.dirname(fname) or '.'
+    fd, tmp_fname = tempfile.mkstemp(prefix='.' + os.path.basename(fname) + '.', suffix='.tmp', dir=fldr)
+
+    try:
+        with os.fdopen(fd, mode) as f:
+            writer(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # mkstemp creates the file readable by its owner only - keep the permissions of the file it replaces
+        os.chmod(tmp_fname, _file_mode(fname))
+        replace_file(tmp_fname, fname)
+    except:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+        raise
@@ -0,0 +1,153 @@
+
+import os
+import pickle
+import shutil
+import hashlib
+
+from bbg_io import atomic_write
+
+
+class BbgJobJournal():
+    """Write-ahead journal for a batch refresh.
+
+    Each security is keyed by its local file. Every payload fetched from Bloomberg (meta, ts, ts update)
+    is written to a side file right after its request and noted in the journal; once the security is saved
+    it is marked done and its side files are removed, so the journal itself only holds small records. A
+    restarted job replays the journal, skips securities already done and reuses pending payloads instead
+    of going back to Bloomberg.
+    The journal belongs to the job for as_of (e.g. get_last_bdate()): a journal left by a job for another
+    date is discarded. Call finish() once the whole job has completed."""
+
+    JOB = 'job'
+    FETCHED = 'fetched'
+    DONE = 'done'
+
+    def __init__(self, filename, as_of):
+        self.filename = filename
+        self.as_of = as_of
+        self.parts_fldr = os.path.splitext(filename)[0] + '_parts'
+
+        self._done = set()
+        self._pending = {}
+
+        self._replay()
+        self._f = open(self.filename, 'ab')
+
+        # new job: the first record identifies it, payloads left by any earlier job don't apply
+        self._f.seek(0, os.SEEK_END)
+        if self._f.tell() == 0:
+            self._remove_parts()
+            self._append(self.JOB, self.as_of)
+
+    # --- Replay ----------------------------------------
+    def _replay(self):
+        if not os.path.exists(self.filename):
+            return
+
+        with open(self.filename, 'r+b') as f:
+            good_offset = 0
+            while True:
+                try:
+                    event, key, payload = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    # record cut short by the crash - drop the tail so appends start clean
+                    print('...truncating partial record at end of journal <{}>'.format(self.filename))
+                    f.truncate(good_offset)
+                    break
+
+                # journal of a job for another date - its progress does not apply
+                if good_offset == 0 and (event, key) != (self.JOB, self.as_of):
+                    job = key if event == self.JOB else None
+                    print('...discarding journal <{}> of job as of {}'.format(self.filename, job))
+                    f.truncate(0)
+                    return
+
+                good_offset = f.tell()
+                self._apply(event, key, payload)
+
+        print('...resuming job journal <{}>: {} done, {} pending'.format(self.filename, len(self._done),
+                                                                       len(self._pending)))
+
+    def _apply(self, event, key, payload):
+        if event == self.FETCHED:
+            self._pending.setdefault(key, set()).add(payload)
+        elif event == self.DONE:
+            self._pending.pop(key, None)
+            self._done.add(key)
+
+    def _append(self, event, key, payload=None):
+        pickle.dump((event, key, payload), self._f, pickle.HIGHEST_PROTOCOL)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._apply(event, key, payload)
+
+    # --- Payload Side Files ----------------------------------------
+    def _part_prefix(self, key):
+        return hashlib.md5(key.encode('utf-8')).hexdigest() + '.'
+
+    def _part_file(self, key, part):
+        return os.path.join(self.parts_fldr, self._part_prefix(key) + part + '.pickle')
+
+    def _remove_parts(self, key=None):
+        """remove the side files of key, or all of them"""
+        if not os.path.isdir(self.parts_fldr):
+            return
+
+        if key is None:
+            shutil.rmtree(self.parts_fldr)
+            return
+
+        # also catches payloads written just before a crash, ahead of their journal record
+        prefix = self._part_prefix(key)
+        for fname in os.listdir(self.parts_fldr):
+            if fname.startswith(prefix):
+                os.remove(os.path.join(self.parts_fldr, fname))
+
+    # --- Interface ----------------------------------------
+    def is_done(self, key):
+        return key in self._done
+
+    def get_pending(self, key):
+        """{part: payload} fetched for key but not yet saved, or None"""
+        if key not in self._pending:
+            return None
+
+        pending = {}
+        for part in self._pending[key]:
+            with open(self._part_file(key, part), 'rb') as f:
+                pending[part] = pickle.load(f)
+
+        return pending
+
+    def record_fetched(self, key, part, payload):
+        # payload is on disk before the journal points at it
+        if not os.path.isdir(self.parts_fldr):
+            os.makedirs(self.parts_fldr)
+
+        atomic_write(self._part_file(key, part), lambda f: pickle.dump(payload, f, pickle.HIGHEST_PROTOCOL))
+        self._append(self.FETCHED, key, part)
+
+    def record_done(self, key):
+        self._append(self.DONE, key)
+        self._remove_parts(key)
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def finish(self):
+        """job completed: close and remove the journal so the next run starts a fresh job"""
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+        self._remove_parts()
+
+    def __len__(self):
+        return len(self._done)
+
+    def __repr__(self):
+        return '<JOB JOURNAL: file={}, done={}, pending={}>'.format(self.filename, len(self._done),
+                                                                    len(self._pending))
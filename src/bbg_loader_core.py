@@ -6,6 +6,10 @@ from pandas.tseries.offsets import BDay
 import pickle
 
 from bbg_api import *
+from bbg_io import atomic_write
+
+# contracts rarely trade more than this many years before expiry - bounds data budget estimates
+EST_CONTRACT_LIFE_YEARS = 5
 
 
 # PUT THESE TO BloombergTSLoader.py
@@ -20,13 +24,15 @@ class BbgSecurity():
     FLDS = ['bb_tckr', 'alias', 'local_path', 'ts_flds', 'meta_flds', 'ts', 'meta']
     FILE_EXTENSION = '.pickle'
 
-    def __init__(self, bb_tckr, alias, local_path, ts_flds, meta_flds, ts=None, meta=None):
+    def __init__(self, bb_tckr, alias, local_path, ts_flds, meta_flds, ts=None, meta=None,
+                 priority=BbgDataBudget.NORMAL):
 
         self.bb_tckr = bb_tckr
         self.alias = alias
         self.local_path = local_path
         self.ts_flds = ts_flds
         self.meta_flds = meta_flds
+        self.priority = priority
 
         # -- internals -----
         self._ts = ts
@@ -43,6 +49,8 @@ class BbgSecurity():
         except IOError:
             # TODO : what's a good value to return upon error
             print('...could not read file: ' + filename)
+        except (EOFError, pickle.UnpicklingError):
+            print('...could not read truncated/corrupt file: ' + filename)
 
     @classmethod
     def from_dict(cls, d):
@@ -63,6 +71,10 @@ class BbgSecurity():
         else:
             return self._meta
 
+    @property
+    def local_file(self):
+        return self.local_path + self.alias + self.FILE_EXTENSION
+
     def __len__(self):
         return len(self.ts)
 
@@ -95,26 +107,42 @@ class BbgSecurity():
 
     @property
     def is_up_to_date(self):
-        # TODO: Implement logic here
+        return self.has_data_through(get_last_bdate())
+
+    def has_data_through(self, end_dt):
+        """True if the series ends on end_dt (mm/dd/YYYY)"""
         if len(self) == 0:
             return False
         else:
-            return self.last_datapoint == pd.Timestamp(get_last_bdate())
+            return self.last_datapoint == pd.Timestamp(end_dt)
+
+    @property
+    def request_priority(self):
+        """contracts past their last tradeable date are low priority, whatever the configured priority"""
+        if 'LAST_TRADEABLE_DT' in self.meta and not pd.isnull(self.meta['LAST_TRADEABLE_DT']):
+            if self.meta['LAST_TRADEABLE_DT'] < datetime.now():
+                return BbgDataBudget.LOW
+
+        return self.priority
 
             # --- File / IO ----------------------------------------
 
     def to_dict(self):
         return {f: getattr(self, f) for f in self.FLDS}
 
-    def save(self):
-        fname = self.local_path + self.alias + self.FILE_EXTENSION
+    def save(self, journal=None):
+        """write security to its local file (atomically) and mark it done in the journal, if given"""
+        fname = self.local_file
+        d = self.to_dict()
 
         print('...saving {} to local file <{}>'.format(self.bb_tckr, fname))
-        with open(fname, 'wb') as f:
-            pickle.dump(self.to_dict(), f)
+        atomic_write(fname, lambda f: pickle.dump(d, f))
+
+        if journal is not None:
+            journal.record_done(fname)
 
     def load_local_data(self):
-        fname = self.local_path + self.alias + self.FILE_EXTENSION
+        fname = self.local_file
 
         print('...loading local file <{}> for security={}'.format(fname, self.bb_tckr))
         localObj = self.__class__.from_file(fname)
@@ -123,72 +151,124 @@ class BbgSecurity():
             self._ts, self._meta = localObj.ts, localObj.meta
 
     # ---- Bloomberg Load ------------------------------------
-    def _bbg_load_ts(self):
+    def _est_window(self, start_dt, end_dt):
+        """dates data is expected for: contracts with a known last tradeable date have no data after it"""
+        if 'LAST_TRADEABLE_DT' in self.meta and not pd.isnull(self.meta['LAST_TRADEABLE_DT']):
+            last_dt = pd.Timestamp(self.meta['LAST_TRADEABLE_DT'])
+            start = max(pd.Timestamp(start_dt), last_dt - pd.DateOffset(years=EST_CONTRACT_LIFE_YEARS))
+            end = min(pd.Timestamp(end_dt), last_dt)
+
+            if start <= end:
+                return start.strftime("%m/%d/%Y"), end.strftime("%m/%d/%Y")
+
+        return start_dt, end_dt
+
+    def _journaled_fetch(self, journal, part, fetch):
+        """part fetched by an interrupted run of this job if journaled, else fetch() it and journal it"""
+        pending = journal.get_pending(self.local_file) if journal is not None else None
+        if pending is not None and part in pending:
+            print('...restoring {} for {} from job journal'.format(part, self.bb_tckr))
+            return pending[part]
+
+        res = fetch()
+        if journal is not None:
+            journal.record_fetched(self.local_file, part, res)
+
+        return res
+
+    def _bbg_load_ts(self, journal=None, end_dt=None):
         start_dt = '1/1/1960'
-        end_dt = get_last_bdate()
+        end_dt = end_dt if end_dt is not None else get_last_bdate()
+        est_start, est_end = self._est_window(start_dt, end_dt)
 
         try:
             print('...loading timeseries for {} --> loading data from {} to {}'.format(self.bb_tckr, start_dt, end_dt))
-            res = bbg_load_ts(self.bb_tckr, self.ts_flds, start=start_dt, end=end_dt)
+            res = self._journaled_fetch(journal, 'ts',
+                                        lambda: bbg_load_ts(self.bb_tckr, self.ts_flds, start=start_dt, end=end_dt,
+                                                            est_start=est_start, est_end=est_end))
+        except BudgetExceededError:
+            raise
         except:
             print('Error loading TS fields for security {} from Bloomberg'.format(self.bb_tckr))
             return
 
         self._ts = res
 
-    def _bbg_load_meta(self):
+    def _bbg_load_meta(self, journal=None):
         try:
             print('...loading metadata for {}'.format(self.bb_tckr))
-            res = bbg_load_meta(self.bb_tckr, self.meta_flds)
+            res = self._journaled_fetch(journal, 'meta', lambda: bbg_load_meta(self.bb_tckr, self.meta_flds))
+        except BudgetExceededError:
+            raise
         except:
             print('Error loading Meta fields for security {} from Bloomberg'.format(self.bb_tckr))
             return
 
         self._meta = res
 
-    def _ts_update(self, nOverlap=5):
+    def _ts_update(self, nOverlap=5, journal=None, end_dt=None):
 
         ix_cut_pre = self.ts.index[-nOverlap]
         ix_cut_pst = self.ts.index[-(nOverlap - 1)]
 
         # load update from bloomberg
         start_dt = ix_cut_pre.strftime("%m/%d/%Y")
-        end_dt = get_last_bdate()
+        end_dt = end_dt if end_dt is not None else get_last_bdate()
 
         print('...updating timeseries for {} --> loading data from {} to {}'.format(self.bb_tckr, start_dt, end_dt))
         ts_old = self.ts.copy()
-        ts_new = bbg_load_ts(self.bb_tckr, self.ts_flds, start=start_dt, end=end_dt)
+        ts_new = self._journaled_fetch(journal, 'ts_update',
+                                       lambda: bbg_load_ts(self.bb_tckr, self.ts_flds, start=start_dt, end=end_dt))
 
         # assign to self
         self._ts = pd.concat([ts_old.loc[:ix_cut_pre, :], ts_new.loc[ix_cut_pst:, :]], axis=0).copy()
 
     # ---- Load Procedures ------------------------------------
-    def load_from_scratch(self):
-        self._bbg_load_meta()
-        self._bbg_load_ts()
+    def load_from_scratch(self, journal=None, end_dt=None):
+        self._bbg_load_meta(journal)
+        self._bbg_load_ts(journal, end_dt)
+
+    def update(self, journal=None, reload=True, end_dt=None):
+        """update from Bloomberg & save. reload=False updates the data already held in memory. end_dt
+        (mm/dd/YYYY) is the last date whose data is final, get_last_bdate() by default"""
+        end_dt = end_dt if end_dt is not None else get_last_bdate()
 
-    def update(self):
         print('...updating security {}'.format(self.bb_tckr))
 
+        # resuming an interrupted job: already done
+        if journal is not None and journal.is_done(self.local_file):
+            print('..security {} already updated in this job! Done!'.format(self.bb_tckr))
+            self.load_local_data()
+            return
+
         # Load local data
-        self.load_local_data()
+        if reload:
+            self.load_local_data()
 
         # if is expired
         if self.is_expired:
             print('..security {} is expired! Done!'.format(self.bb_tckr))
-            # do nothing
+            if journal is not None:
+                journal.record_done(self.local_file)
             return
 
         # if is up to date
-        if self.is_up_to_date:
+        if self.has_data_through(end_dt):
             print('..security {} is up to date! Done!'.format(self.bb_tckr))
-            # do nothing
+            if journal is not None:
+                journal.record_done(self.local_file)
+            return
+
+        # if data budget is running low, leave low priority work for a later run
+        budget = get_data_budget()
+        if budget is not None and budget.should_defer(self.request_priority):
+            print('..security {} deferred, data budget running low ({})'.format(self.bb_tckr, budget))
             return
 
         # if doesn't exist, load from scratch
         if len(self) == 0:
-            self.load_from_scratch()
-            self.save()
+            self.load_from_scratch(journal, end_dt)
+            self.save(journal)
             return
 
         # update timeseries & metadata...
@@ -197,19 +277,19 @@ class BbgSecurity():
 
         if all_ts_flds_in_local_data:
             # update TS
-            self._ts_update()
+            self._ts_update(journal=journal, end_dt=end_dt)
         else:
             # load from scratch
-            self._bbg_load_ts()
+            self._bbg_load_ts(journal, end_dt)
 
         # --- Update Meta -----------
         all_meta_flds_in_local_data = all([True for fld in self.meta_flds if fld in self.meta.index])
 
         if not all_meta_flds_in_local_data:
-            self._bbg_load_meta()
+            self._bbg_load_meta(journal)
 
         # Save back to file
-        self.save()
+        self.save(journal)
 
     def __repr__(self):
         return ('<BBG SECURITY: tckr=' + self.bb_tckr + ', alias=' + self.alias +
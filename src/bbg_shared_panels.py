@@ -0,0 +1,143 @@
+
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+
+
+def load_partitions(db_fldr, db_name, extension='.pkl'):
+    """read the partition files written by export_to_db for db_name into a single {tckr: ts} dict"""
+    fldr = db_fldr + db_name + '/'
+
+    panels = {}
+    for fname in sorted(os.listdir(fldr)):
+        if fname.endswith(extension):
+            print('...reading partition {}'.format(fldr + fname))
+            with open(fldr + fname, 'rb') as f:
+                panels.update(pickle.load(f))
+
+    return panels
+
+
+def _attach(name):
+    """attach to an existing block without handing its lifetime to this process' resource tracker"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # python 3.13+
+    except TypeError:
+        # older pythons always register, and the tracker would unlink the block when this process exits
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedPanelPublisher():
+    """Publishes time-series panels ({key: DataFrame with a datetime index and numeric columns}) once into
+    a single shared memory block, each panel as an int64 index array followed by a float64 value array.
+
+    Workers get the small, picklable descriptor and attach with SharedPanelReader. The publisher owns the
+    block: keep it alive while workers run, then close() it (or use it as a context manager)."""
+
+    def __init__(self, panels, name=None):
+
+        # --- layout: byte offsets of each panel's index & values -----
+        layout = {}
+        offset = 0
+        for key, df in panels.items():
+            n_rows, n_cols = df.shape
+            layout[key] = {'index': offset, 'values': offset + 8 * n_rows, 'shape': (n_rows, n_cols),
+                           'columns': list(df.columns)}
+            offset += 8 * n_rows * (1 + n_cols)
+
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+
+        # --- copy panels into the block -----
+        index = values = None
+        try:
+            for key, df in panels.items():
+                index, values = self._views(self._shm, layout[key])
+                index[:] = pd.DatetimeIndex(df.index).values.astype('datetime64[ns]')
+                values[:] = df.values.astype(np.float64)
+        except:
+            # nobody else knows the block yet - release the views and don't leave it behind in shared memory
+            index = values = None
+            self._shm.close()
+            self._shm.unlink()
+            raise
+
+        self.descriptor = {'name': self._shm.name, 'panels': layout}
+
+        print('...published {} panels to shared memory <{}> ({:.1f} MB)'.format(len(layout), self._shm.name,
+                                                                             offset / 1e6))
+
+    @classmethod
+    def from_db(cls, db_fldr, db_name, name=None):
+        return cls(load_partitions(db_fldr, db_name), name=name)
+
+    @staticmethod
+    def _views(shm, lay):
+        n_rows, n_cols = lay['shape']
+        index = np.ndarray((n_rows,), dtype='datetime64[ns]', buffer=shm.buf, offset=lay['index'])
+        values = np.ndarray((n_rows, n_cols), dtype=np.float64, buffer=shm.buf, offset=lay['values'])
+        return index, values
+
+    def close(self):
+        """release and unlink the block. Workers must have detached first"""
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return '<SHARED PANELS: name={}, panels={}>'.format(self._shm.name, len(self.descriptor['panels']))
+
+
+class SharedPanelReader():
+    """Read-only, zero-copy access to panels published by SharedPanelPublisher, from any local process.
+    Panels are DataFrames over non-writeable views of the shared block; drop them before close()"""
+
+    def __init__(self, descriptor):
+        self._shm = _attach(descriptor['name'])
+        self._layout = descriptor['panels']
+        self._panels = {}
+
+    def keys(self):
+        return list(self._layout.keys())
+
+    def __contains__(self, key):
+        return key in self._layout
+
+    def __len__(self):
+        return len(self._layout)
+
+    def __getitem__(self, key):
+        if key not in self._panels:
+            lay = self._layout[key]
+            index, values = SharedPanelPublisher._views(self._shm, lay)
+            index.flags.writeable = False
+            values.flags.writeable = False
+
+            self._panels[key] = pd.DataFrame(values, index=pd.DatetimeIndex(index, copy=False),
+                                             columns=lay['columns'], copy=False)
+
+        return self._panels[key]
+
+    def close(self):
+        self._panels = {}
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return '<SHARED PANEL READER: name={}, panels={}>'.format(self._shm.name, len(self._layout))
@@ -73,12 +73,23 @@ class BbgFuturesTckr():
 class FuturesChainReference:
     """Handles Futures Chain Data. Requires *futchain.csv* to be up to date"""
     _fut_chain = None
+    _fut_chain_src = None
 
     def __init__(self, fut_chain_src=None):
         if FuturesChainReference._fut_chain is None:
-            FuturesChainReference._fut_chain = self._load_historical_futures_chain(fut_chain_src)
+            FuturesChainReference.reload(fut_chain_src)
 
-    def _load_historical_futures_chain(self, srcfile):
+    @classmethod
+    def reload(cls, fut_chain_src=None):
+        """(re)load the shared futures chain cache, from the last source file if none given"""
+        if fut_chain_src is not None:
+            FuturesChainReference._fut_chain_src = fut_chain_src
+
+        src = FuturesChainReference._fut_chain_src
+        FuturesChainReference._fut_chain = cls._load_historical_futures_chain(src)
+
+    @staticmethod
+    def _load_historical_futures_chain(srcfile):
         """load futures chain tickers stored in csv file"""
         df = pd.read_csv(srcfile)
         return {df[bbg_root][2]: list(df[bbg_root][3:]) for bbg_root in df.columns}